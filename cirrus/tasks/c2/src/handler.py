@@ -7,16 +7,24 @@ updates asset links to point to S3 storage, and prepares items for STAC
 server ingestion. Designed to work with the Cirrus framework.
 """
 
-import json
+import asyncio
 import os
 import logging
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 
+import aioboto3
+import aiohttp
 import boto3
+import boto3.s3.transfer
+import botocore.config
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pystac_client import Client
-from pystac import Item
+from pystac_client.stac_api_io import StacApiIO
+from pystac import Asset, Item
 import planetary_computer
 
 
@@ -33,9 +41,59 @@ API_MODIFIER = planetary_computer.sign_inplace
 CIRRUS_DATA_BUCKET = os.getenv("CIRRUS_DATA_BUCKET")
 CIRRUS_PAYLOAD_BUCKET = os.getenv("CIRRUS_PAYLOAD_BUCKET")
 TASK_NAME = "planetary-computer-to-s3"
+# Largest page size accepted by the Planetary Computer STAC API
+SEARCH_PAGE_LIMIT = 1000
+PAYLOAD_SIZE_THRESHOLD = 240000  # 240KB
+# Estimated payloads below this size skip serialization in the size check
+PAYLOAD_ESTIMATE_SAFE_SIZE = 180000
+# Upper bound for one signed Planetary Computer Sentinel-2 item
+FEATURE_SIZE_ESTIMATE = 32000
+INDEXED_LINK_RELS = frozenset({"canonical", "collection", "root"})
+# Asset transfers in flight across all items; bounds network and memory use.
+# 8 transfers x ~40MB of part buffers stays well inside the 1024MB Lambda.
+MAX_CONCURRENT_TRANSFERS = 8
+ASSET_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=300, sock_read=300)
+
+# Multipart settings for streaming assets. Each transfer holds up to
+# io queue + concurrency + 2 parts in memory (the part being read and the
+# initial threshold buffer are kept alongside queued and uploading parts),
+# i.e. about 5 x 8MB.
+ASSET_TRANSFER_CONFIG = boto3.s3.transfer.TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=2,
+    max_io_queue=1,
+)
+
+# HTTP session reused across STAC API requests
+_http = requests.Session()
+_http.mount(
+    "https://",
+    HTTPAdapter(
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    ),
+)
+
+# AWS client settings shared by the sync and async S3 clients. Adaptive
+# retries back off client-side when S3 throttles with 503 SlowDown.
+S3_CLIENT_CONFIG = botocore.config.Config(
+    max_pool_connections=64,
+    retries={"mode": "adaptive", "max_attempts": 10},
+    tcp_keepalive=True,
+    connect_timeout=3,
+    read_timeout=30,
+)
+
+# AWS clients: sync for the payload upload, async session for asset transfers
+s3_client = boto3.client("s3", config=S3_CLIENT_CONFIG)
+aio_session = aioboto3.Session()
 
-# AWS client
-s3_client = boto3.client("s3")
+# Planetary Computer STAC client, opened on first use and reused while warm
+_pc_client: Optional[Client] = None
 
 
 def lambda_handler(
@@ -55,7 +113,12 @@ def lambda_handler(
         Updated Cirrus payload with processed features or S3 URL reference
     """
     try:
-        logger.info(f"Processing event: {json.dumps(event, default=str)}")
+        logger.info("Processing payload: %s", event.get("id"))
+        # Dumping the full event is expensive, so only do it at DEBUG level
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Processing event: %s", orjson.dumps(event, default=str).decode()
+            )
 
         # Extract configuration from the payload
         process_config = event["process"][0]
@@ -82,28 +145,27 @@ def lambda_handler(
         stac_items = query_planetary_computer(tile, date, max_items, download_assets)
         logger.info(f"Found {len(stac_items)} STAC items")
 
-        # Process items based on configuration
-        processed_features = []
-        for item in stac_items:
-            if download_assets:
-                # Download assets to S3 and update hrefs
-                updated_item = download_and_update_item(item)
-            else:
-                # Just update metadata for indexing
-                updated_item = prepare_item_for_indexing(item)
-
-            processed_features.append(updated_item.to_dict())
-
-        # Update the payload with processed features
+        # Process items straight into the payload's feature list
         if "features" not in event:
             event["features"] = []
-        event["features"].extend(processed_features)
+        features = event["features"]
+        n_existing = len(features)
+
+        if download_assets:
+            # Download assets to S3 and update hrefs
+            features.extend(asyncio.run(_download_items(stac_items)))
+        else:
+            # Just update metadata for indexing
+            features.extend(prepare_item_for_indexing(item) for item in stac_items)
 
-        logger.info(f"Successfully processed {len(processed_features)} features")
+        logger.info(f"Successfully processed {len(features) - n_existing} features")
 
         # Check if payload exceeds Step Functions limit and upload to S3 if needed
-        if should_upload_to_s3(event):
-            s3_url = upload_payload_to_s3(event)
+        payload_body, upload_to_s3 = serialize_and_decide(
+            event, len(features) - n_existing
+        )
+        if upload_to_s3:
+            s3_url = upload_bytes_to_s3(payload_body, event["id"])
             # Return minimal payload with URL reference (Cirrus pattern)
             return {"url": s3_url}
         else:
@@ -119,33 +181,55 @@ def lambda_handler(
             {
                 "task": "planetary-computer-to-s3",
                 "error": str(e),
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
             }
         )
         raise
 
 
+def _get_client() -> Client:
+    """
+    Return the Planetary Computer STAC client, opening it on first use.
+
+    Warm Lambda invocations reuse the client and skip fetching the landing
+    page and conformance classes again.
+
+    Returns:
+        STAC API client that signs results in place
+    """
+    global _pc_client
+    if _pc_client is None:
+        # Share the module-level pooled, retrying session
+        stac_io = StacApiIO(max_retries=None)
+        stac_io.session = _http
+        _pc_client = Client.open(STAC_API_URL, modifier=API_MODIFIER, stac_io=stac_io)
+    return _pc_client
+
+
 def query_planetary_computer(
-    tile: str, date: str, max_items: int = 100, download_assets: bool = False
-) -> List[Item]:
+    tile: str,
+    date: str,
+    max_items: Optional[int] = 100,
+    download_assets: bool = False,
+) -> List[Dict[str, Any]]:
     """
     Query Planetary Computer for Sentinel-2 L2A data.
 
     Args:
         tile: MGRS tile identifier (e.g., '33UUP')
         date: Date string in format 'YYYY-MM-DD' or 'YYYY-MM-DD/YYYY-MM-DD'
-        max_items: Maximum number of items to return (safety limit)
+        max_items: Maximum number of items to return (safety limit, None for no limit)
         download_assets: Whether assets will be downloaded (affects logging)
 
     Returns:
-        List of STAC items (limited by max_items)
+        List of STAC item dictionaries (limited by max_items)
     """
     logger.info(
         f"Querying Planetary Computer for tile {tile} on {date}, max_items: {max_items}"
     )
 
     try:
-        client = Client.open(STAC_API_URL, modifier=API_MODIFIER)
+        client = _get_client()
 
         # Handle date range or single date
         if "/" in date:
@@ -154,16 +238,27 @@ def query_planetary_computer(
             # Convert single date to a day range
             start_date = datetime.fromisoformat(date)
             end_date = start_date + timedelta(days=1)
-            datetime_query = f"{start_date.isoformat()}/{end_date.isoformat()}"
+            if len(date) == 10:
+                # Plain YYYY-MM-DD: reuse the input string for the start bound
+                datetime_query = (
+                    f"{date}T00:00:00Z/{end_date.strftime('%Y-%m-%d')}T00:00:00Z"
+                )
+            else:
+                datetime_query = f"{start_date.isoformat()}/{end_date.isoformat()}"
 
         search = client.search(
             collections=[COLLECTION],
             datetime=datetime_query,
-            query={"s2:mgrs_tile": {"eq": tile}},
+            filter_lang="cql2-json",
+            filter={"op": "=", "args": [{"property": "s2:mgrs_tile"}, tile]},
             max_items=max_items,  # Limit results for safety
+            # Pages are chained by opaque tokens and can't be fetched in
+            # parallel, so ask for everything in as few pages as possible
+            # (pystac-client clamps this to max_items)
+            limit=SEARCH_PAGE_LIMIT,
         )
 
-        items = list(search.items())
+        items = list(search.items_as_dicts())
 
         logger.info(f"Found {len(items)} items for tile {tile}")
 
@@ -188,91 +283,182 @@ def query_planetary_computer(
         raise
 
 
-def download_and_update_item(item: Item) -> Item:
+async def _download_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Download assets for all items concurrently on a single event loop.
+
+    Args:
+        items: Original STAC item dictionaries from Planetary Computer
+
+    Returns:
+        Item dictionaries with S3 hrefs
+    """
+    transfer_limit = asyncio.Semaphore(MAX_CONCURRENT_TRANSFERS)
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=32)
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=ASSET_TIMEOUT, auto_decompress=False
+    ) as http, aio_session.client("s3", config=S3_CLIENT_CONFIG) as s3:
+        # Let every item's transfers settle (including aborting failed
+        # multipart uploads) before the sessions close, then surface the
+        # first failure
+        results = await asyncio.gather(
+            *[
+                download_and_update_item(Item.from_dict(item), http, s3, transfer_limit)
+                for item in items
+            ],
+            return_exceptions=True,
+        )
+
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+    return [item.to_dict() for item in results]
+
+
+async def download_and_update_item(
+    item: Item,
+    http: aiohttp.ClientSession,
+    s3: Any,
+    transfer_limit: asyncio.Semaphore,
+) -> Item:
     """
     Download GeoTIFF assets to S3 and update item hrefs.
 
     Args:
         item: Original STAC item from Planetary Computer
+        http: HTTP session used to download assets
+        s3: Async S3 client used to upload assets
+        transfer_limit: Semaphore bounding concurrent asset transfers
 
     Returns:
         Updated STAC item with S3 hrefs
     """
     logger.info(f"Downloading assets for item: {item.id}")
 
-    # Sign the item to get proper download URLs
-    signed_item = planetary_computer.sign(item)
-
-    for asset_key, asset in signed_item.assets.items():
-        if asset.media_type and "geotiff" in asset.media_type:
-            try:
-                # Download the asset using the signed URL
-                response = requests.get(asset.href, timeout=300)
-                response.raise_for_status()
-                logger.info(f"Downloaded {asset_key} for {item.id}. Uploading to {CIRRUS_DATA_BUCKET}")
-
-                # Generate S3 key
-                s3_key = f"sentinel-2-l2a/{item.id}/{asset_key}.tif"
-
-                # Upload to S3
-                s3_client.put_object(
-                    Bucket=CIRRUS_DATA_BUCKET,
-                    Key=s3_key,
-                    Body=response.content,
-                    ContentType=asset.media_type,
-                )
+    # The client modifier signs search results in place; only sign again if
+    # the hrefs are missing their SAS token
+    if any("?" not in asset.href for asset in item.assets.values()):
+        planetary_computer.sign_inplace(item)
+
+    asset_items = [
+        (asset_key, asset)
+        for asset_key, asset in item.assets.items()
+        if asset.media_type and "geotiff" in asset.media_type
+    ]
+
+    results = await asyncio.gather(
+        *[
+            _transfer_asset(asset_key, asset, item.id, http, s3, transfer_limit)
+            for asset_key, asset in asset_items
+        ],
+        return_exceptions=True,
+    )
 
-                # Update asset href in original item
-                item.assets[asset_key].href = f"s3://{CIRRUS_DATA_BUCKET}/{s3_key}"
-                logger.info(f"Updated {asset_key} for {item.id}")
+    for (asset_key, asset), result in zip(asset_items, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                f"Failed to process asset {asset_key} for {item.id}: {str(result)}. href: {asset.href}"
+            )
+            continue
+        if isinstance(result, BaseException):
+            # Cancellation is not an asset failure; let it propagate
+            raise result
 
-            except Exception as e:
-                logger.warning(
-                    f"Failed to process asset {asset_key} for {item.id}: {str(e)}. href: {asset.href}"
-                )
+        # Update asset href in original item
+        item.assets[asset_key].href = result
+        logger.info(f"Updated {asset_key} for {item.id}")
 
     return item
 
 
-def prepare_item_for_indexing(item: Item) -> Item:
+async def _transfer_asset(
+    asset_key: str,
+    asset: Asset,
+    item_id: str,
+    http: aiohttp.ClientSession,
+    s3: Any,
+    transfer_limit: asyncio.Semaphore,
+) -> str:
+    """
+    Download a single asset and upload it to the data bucket.
+
+    Args:
+        asset_key: Key of the asset within the item
+        asset: Signed STAC asset to download
+        item_id: ID of the item the asset belongs to
+        http: HTTP session used to download the asset
+        s3: Async S3 client used to upload the asset
+        transfer_limit: Semaphore bounding concurrent asset transfers
+
+    Returns:
+        S3 href of the uploaded asset
+    """
+    # Generate S3 key
+    s3_key = f"sentinel-2-l2a/{item_id}/{asset_key}.tif"
+
+    async with transfer_limit:
+        # Stream the asset using the signed URL. GeoTIFFs are already
+        # compressed, so ask for the body as-is and pass the bytes through.
+        async with http.get(
+            asset.href, headers={"Accept-Encoding": "identity"}
+        ) as response:
+            response.raise_for_status()
+            logger.info(f"Streaming {asset_key} for {item_id} to {CIRRUS_DATA_BUCKET}")
+
+            # Multipart upload straight from the response body
+            await s3.upload_fileobj(
+                response.content,
+                CIRRUS_DATA_BUCKET,
+                s3_key,
+                ExtraArgs={
+                    "ContentType": asset.media_type,
+                    "ChecksumAlgorithm": "CRC32",
+                },
+                Config=ASSET_TRANSFER_CONFIG,
+            )
+
+    return f"s3://{CIRRUS_DATA_BUCKET}/{s3_key}"
+
+
+def prepare_item_for_indexing(item: Dict[str, Any]) -> Dict[str, Any]:
     """
     Prepare STAC item for indexing without downloading assets.
 
     Updates metadata and collection information to ensure proper indexing
-    in the STAC server.
+    in the STAC server. Works on the raw item dictionary so no pystac Item
+    has to be built on the metadata-only path.
 
     Args:
-        item: Original STAC item from Planetary Computer
+        item: Original STAC item dictionary from Planetary Computer
 
     Returns:
-        STAC item prepared for indexing
+        STAC item dictionary prepared for indexing
     """
     # Ensure collection is set properly
-    # item.collection = "sentinel-2-l2a"
+    # item["collection"] = "sentinel-2-l2a"
 
     # Update links to remove unnecessary ones and mark canonical
-    links_to_remove = []
-    for link in item.links:
-        if link.rel == "self":
-            link.rel = "canonical"
-        elif link.rel not in ["canonical", "collection", "root"]:
-            links_to_remove.append(link)
-
-    for link in links_to_remove:
-        item.links.remove(link)
+    item["links"] = [
+        {**link, "rel": "canonical"} if link["rel"] == "self" else link
+        for link in item.get("links", [])
+        if link["rel"] == "self" or link["rel"] in INDEXED_LINK_RELS
+    ]
 
     return item
 
 
-def upload_payload_to_s3(payload: Dict[str, Any]) -> str:
+def upload_bytes_to_s3(body: bytes, payload_id: str) -> str:
     """
-    Upload payload to S3 and return the URL.
+    Upload a serialized payload to S3 and return the URL.
 
     This follows the Cirrus pattern for handling large payloads that exceed
     Step Functions' 256KB limit.
 
     Args:
-        payload: The payload dictionary to upload
+        body: The payload already serialized by serialize_and_decide
+        payload_id: ID of the payload, used to build the S3 key
 
     Returns:
         S3 URL where the payload was uploaded
@@ -281,13 +467,16 @@ def upload_payload_to_s3(payload: Dict[str, Any]) -> str:
         raise ValueError("CIRRUS_PAYLOAD_BUCKET environment variable not set")
 
     try:
-        url = f"s3://{CIRRUS_PAYLOAD_BUCKET}/{TASK_NAME}/{payload['id']}.json"
-        s3_key = f"{TASK_NAME}/{payload['id']}.json"
+        url = f"s3://{CIRRUS_PAYLOAD_BUCKET}/{TASK_NAME}/{payload_id}.json"
+        s3_key = f"{TASK_NAME}/{payload_id}.json"
         s3_client.put_object(
             Bucket=CIRRUS_PAYLOAD_BUCKET,
             Key=s3_key,
-            Body=json.dumps(payload, default=str).encode("utf-8"),
+            Body=body,
+            ContentLength=len(body),
             ContentType="application/json",
+            # CRC32 is much cheaper to compute than MD5 on every retry
+            ChecksumAlgorithm="CRC32",
         )
         logger.info(f"Uploaded payload to S3: {url}")
         return url
@@ -297,31 +486,48 @@ def upload_payload_to_s3(payload: Dict[str, Any]) -> str:
         raise
 
 
-def should_upload_to_s3(payload: Dict[str, Any]) -> bool:
+def serialize_and_decide(
+    payload: Dict[str, Any], n_new_features: int = 0
+) -> Tuple[Optional[bytes], bool]:
     """
-    Determine if payload should be uploaded to S3 based on size.
+    Serialize the payload and determine if it should be uploaded to S3.
+
+    The serialized bytes are returned so the upload does not have to encode
+    the payload a second time. Payloads whose estimated size is well below
+    the threshold are not serialized in full.
 
     Args:
         payload: The payload to check
+        n_new_features: Number of Planetary Computer items appended to the
+            end of the payload's features by this task
 
     Returns:
-        True if payload should be uploaded to S3, False otherwise
+        Tuple of (serialized payload or None if serialization was skipped,
+        True if it should be uploaded to S3)
     """
-    try:
-        payload_json = json.dumps(payload, default=str)
-        payload_size = len(payload_json.encode("utf-8"))
-
-        # Upload to S3 if payload is larger than 240KB (leaving buffer below 256KB limit)
-        threshold = 240000  # 240KB
-        should_upload = payload_size > threshold
-
-        logger.info(
-            f"Payload size: {payload_size} bytes, threshold: {threshold} bytes, upload_to_s3: {should_upload}"
+    # Upload to S3 if payload is larger than 240KB (leaving buffer below 256KB limit)
+    threshold = PAYLOAD_SIZE_THRESHOLD
+
+    # Cheap upper-bound estimate: measure everything except the items this
+    # task appended exactly, and assume a generous fixed size for those
+    if n_new_features:
+        features = payload.get("features", [])
+        known = {**payload, "features": features[: len(features) - n_new_features]}
+        estimated_size = (
+            len(orjson.dumps(known, default=str))
+            + FEATURE_SIZE_ESTIMATE * n_new_features
         )
-        return should_upload
+        if estimated_size < PAYLOAD_ESTIMATE_SAFE_SIZE:
+            logger.info(
+                f"Estimated payload size: {estimated_size} bytes, threshold: {threshold} bytes, upload_to_s3: False"
+            )
+            return None, False
 
-    except Exception as e:
-        logger.warning(
-            f"Could not determine payload size, defaulting to S3 upload: {str(e)}"
-        )
-        return True
+    payload_body = orjson.dumps(payload, default=str)
+    payload_size = len(payload_body)
+    should_upload = payload_size > threshold
+
+    logger.info(
+        f"Payload size: {payload_size} bytes, threshold: {threshold} bytes, upload_to_s3: {should_upload}"
+    )
+    return payload_body, should_upload
@@ -11,3 +11,20 @@ resource "aws_s3_bucket" "cirrus_payload_bucket" {
   bucket_prefix = "${var.resource_prefix}-payload-"
   force_destroy = true
 }
+
+resource "aws_s3_bucket_lifecycle_configuration" "cirrus_data_bucket_lifecycle" {
+  count = var.cirrus_data_bucket == "" ? 1 : 0
+
+  bucket = aws_s3_bucket.cirrus_data_bucket[0].id
+
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}